@@ -1,48 +1,301 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, W, E
+import PIL
 from PIL import Image, ImageTk
+import numpy as np
 import threading
 import time
 from datetime import datetime
 import os
-import sys
-import subprocess
+import argparse
+import shutil
+import re
+import fcntl
+import struct
+import mmap
+import select
+from fractions import Fraction
+
+try:
+    from numba import njit, prange
+except ImportError: # Optional: falls back to cv2.resize + cv2.cvtColor
+    njit = None
+
+try:
+    import av
+except ImportError: # Optional: without PyAV, MJPG recordings are re-encoded by cv2.VideoWriter
+    av = None
+
+# Pillow-SIMD ships as "<version>.postN"; its AVX2 resize can beat cv2.resize for the preview
+PILLOW_SIMD = ".post" in PIL.__version__
+
+SLIDER_DEBOUNCE_MS = 100  # A slider is applied once it has been still for this long
+RECORD_RING_SIZE = 8  # Frames buffered between the grab thread and the video writer (power of two)
+
+# V4L2 ioctl request codes (_IOWR('V', nr, size)) used to set controls without v4l2-ctl
+VIDIOC_S_CTRL = 0xc008561c      # struct v4l2_control { __u32 id; __s32 value; }
+VIDIOC_QUERYCTRL = 0xc0445624   # struct v4l2_queryctrl (68 bytes)
+V4L2_CTRL_FLAG_NEXT_CTRL = 0x80000000
+V4L2_CTRL_TYPE_INTEGER64 = 5
+V4L2_QUERYCTRL_FORMAT = "II32siiiiI8x"
+
+# Structures used by the direct streaming capture (native layout, so valid on 32- and 64-bit)
+V4L2_FORMAT_FORMAT = "@I0P200s0P"           # struct v4l2_format { type; union fmt[200] }
+V4L2_PIX_FORMAT_OFFSET = struct.calcsize("@I0P")
+V4L2_REQUESTBUFFERS_FORMAT = "@IIIIB3x"     # count, type, memory, capabilities, flags
+V4L2_BUFFER_FORMAT = "@IIIIIllIIBBBB4sIILIIi0l"  # struct v4l2_buffer (timeval/timecode inline)
+V4L2_BUF_TYPE_VIDEO_CAPTURE = 1
+V4L2_MEMORY_MMAP = 1
+V4L2_PIX_FMT_MJPEG = cv2.VideoWriter_fourcc(*'MJPG')
+V4L2_PIX_FMT_YUYV = cv2.VideoWriter_fourcc(*'YUYV')
+
+
+def _iowr(nr, fmt):
+    return (3 << 30) | (struct.calcsize(fmt) << 16) | (ord('V') << 8) | nr
+
+
+VIDIOC_G_FMT = _iowr(4, V4L2_FORMAT_FORMAT)
+VIDIOC_S_FMT = _iowr(5, V4L2_FORMAT_FORMAT)
+VIDIOC_REQBUFS = _iowr(8, V4L2_REQUESTBUFFERS_FORMAT)
+VIDIOC_QUERYBUF = _iowr(9, V4L2_BUFFER_FORMAT)
+VIDIOC_QBUF = _iowr(15, V4L2_BUFFER_FORMAT)
+VIDIOC_DQBUF = _iowr(17, V4L2_BUFFER_FORMAT)
+VIDIOC_STREAMON = (1 << 30) | (4 << 16) | (ord('V') << 8) | 18   # _IOW('V', 18, int)
+VIDIOC_STREAMOFF = (1 << 30) | (4 << 16) | (ord('V') << 8) | 19  # _IOW('V', 19, int)
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def fused_bgr_resize_rgba(src, dst):
+        """Bilinear-resize a BGR frame into an RGBA buffer in a single pass (OpenCV pixel centers)."""
+        sh, sw = src.shape[0], src.shape[1]
+        dh, dw = dst.shape[0], dst.shape[1]
+        fy = sh / dh
+        fx = sw / dw
+        for i in prange(dh):
+            sy = min(max((i + 0.5) * fy - 0.5, 0.0), sh - 1.0)
+            y0 = int(sy)
+            y1 = min(y0 + 1, sh - 1)
+            wy = sy - y0
+            for j in range(dw):
+                sx = min(max((j + 0.5) * fx - 0.5, 0.0), sw - 1.0)
+                x0 = int(sx)
+                x1 = min(x0 + 1, sw - 1)
+                wx = sx - x0
+                for c in range(3):
+                    top = src[y0, x0, c] * (1.0 - wx) + src[y0, x1, c] * wx
+                    bottom = src[y1, x0, c] * (1.0 - wx) + src[y1, x1, c] * wx
+                    dst[i, j, 2 - c] = np.uint8(top * (1.0 - wy) + bottom * wy + 0.5)
+                dst[i, j, 3] = 255
+else:
+    fused_bgr_resize_rgba = None
+
+
+class V4L2Capture:
+    """Minimal single-buffer V4L2 streaming capture with the subset of the cv2.VideoCapture API used here.
+
+    Only one mmap buffer is requested. After each dequeue the data is copied out and the buffer is
+    queued again before decoding, so the driver never holds a backlog of stale frames.
+    Supports MJPG and YUYV pixel formats.
+    """
+
+    def __init__(self, device_index):
+        self.fd = os.open(f"/dev/video{device_index}", os.O_RDWR | os.O_NONBLOCK)
+        self.convert_rgb = True
+        self.buffer = None
+        try:
+            self._setup()
+        except OSError:
+            self.release()
+            raise
+
+    def _setup(self):
+        fmt = bytearray(struct.calcsize(V4L2_FORMAT_FORMAT))
+        struct.pack_into("I", fmt, 0, V4L2_BUF_TYPE_VIDEO_CAPTURE)
+        fcntl.ioctl(self.fd, VIDIOC_G_FMT, fmt)
+        # Prefer MJPG at the current resolution; keep the driver's format if it refuses
+        struct.pack_into("I", fmt, V4L2_PIX_FORMAT_OFFSET + 8, V4L2_PIX_FMT_MJPEG)
+        try:
+            fcntl.ioctl(self.fd, VIDIOC_S_FMT, fmt)
+        except OSError:
+            fcntl.ioctl(self.fd, VIDIOC_G_FMT, fmt)
+        self.width, self.height, self.pixelformat, _, self.bytesperline = \
+            struct.unpack_from("5I", fmt, V4L2_PIX_FORMAT_OFFSET)
+        if self.pixelformat not in (V4L2_PIX_FMT_MJPEG, V4L2_PIX_FMT_YUYV):
+            raise OSError(f"Unsupported pixel format {self.pixelformat.to_bytes(4, 'little').decode(errors='replace')}")
+
+        reqbufs = bytearray(struct.pack(V4L2_REQUESTBUFFERS_FORMAT, 1, V4L2_BUF_TYPE_VIDEO_CAPTURE,
+                                        V4L2_MEMORY_MMAP, 0, 0))
+        fcntl.ioctl(self.fd, VIDIOC_REQBUFS, reqbufs)
+        count = struct.unpack(V4L2_REQUESTBUFFERS_FORMAT, reqbufs)[0]
+        if count != 1:
+            # Drivers may round the count up; with buffers left unqueued streaming would stall
+            raise OSError(f"Driver allocated {count} buffers, direct capture needs exactly 1")
+
+        buf = self._buffer_struct()
+        fcntl.ioctl(self.fd, VIDIOC_QUERYBUF, buf)
+        fields = struct.unpack(V4L2_BUFFER_FORMAT, buf)
+        offset, length = fields[16], fields[17]
+        self.buffer = mmap.mmap(self.fd, length, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE,
+                                offset=offset)
+
+        fcntl.ioctl(self.fd, VIDIOC_QBUF, self._buffer_struct())
+        fcntl.ioctl(self.fd, VIDIOC_STREAMON, struct.pack("i", V4L2_BUF_TYPE_VIDEO_CAPTURE))
+
+    @staticmethod
+    def _buffer_struct():
+        return bytearray(struct.pack(V4L2_BUFFER_FORMAT, 0, V4L2_BUF_TYPE_VIDEO_CAPTURE, 0, 0, 0, 0, 0,
+                                     0, 0, 0, 0, 0, 0, b"", 0, V4L2_MEMORY_MMAP, 0, 0, 0, 0))
+
+    def isOpened(self):
+        return self.fd is not None and self.buffer is not None
+
+    def read(self, image=None):
+        readable, _, _ = select.select([self.fd], [], [], 1.0)
+        if not readable:
+            return False, None
+        buf = self._buffer_struct()
+        try:
+            fcntl.ioctl(self.fd, VIDIOC_DQBUF, buf)
+        except OSError:
+            return False, None
+        bytesused = struct.unpack(V4L2_BUFFER_FORMAT, buf)[2]
+        data = self.buffer[:bytesused]
+        fcntl.ioctl(self.fd, VIDIOC_QBUF, buf) # Hand the buffer back before decoding
+
+        raw = np.frombuffer(data, dtype=np.uint8)
+        if self.pixelformat == V4L2_PIX_FMT_MJPEG:
+            if not self.convert_rgb:
+                return True, raw
+            frame = cv2.imdecode(raw, cv2.IMREAD_COLOR)
+            return frame is not None, frame
+        yuyv = raw[:self.bytesperline * self.height].reshape(self.height, self.bytesperline // 2, 2)
+        yuyv = yuyv[:, :self.width]
+        if image is not None and image.shape == (self.height, self.width, 3):
+            return True, cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV, dst=image)
+        return True, cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV)
+
+    def get(self, prop):
+        return {
+            cv2.CAP_PROP_FRAME_WIDTH: self.width,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+            cv2.CAP_PROP_FOURCC: self.pixelformat,
+            cv2.CAP_PROP_BUFFERSIZE: 1,
+            cv2.CAP_PROP_CONVERT_RGB: int(self.convert_rgb),
+        }.get(prop, 0)
+
+    def set(self, prop, value):
+        # Format and buffer count are fixed when streaming starts; only decoding can be toggled
+        if prop == cv2.CAP_PROP_CONVERT_RGB:
+            self.convert_rgb = bool(value)
+            return True
+        return False
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            fcntl.ioctl(self.fd, VIDIOC_STREAMOFF, struct.pack("i", V4L2_BUF_TYPE_VIDEO_CAPTURE))
+        except OSError:
+            pass
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        os.close(self.fd)
+        self.fd = None
 
 class ArducamGUIController:
-    def __init__(self, root, device_index=0, initial_exposure=7000, initial_framerate=30):
+    def __init__(self, root, device_index=0, initial_exposure=7000, initial_framerate=30, verbose=False,
+                 direct_capture=False):
         self.root = root
         self.root.title("Arducam V4L2 GUI Controller")
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
         self.device_index = device_index
+        self.verbose = verbose # Also print the live FPS to the console
+        self.direct_capture = direct_capture # Stream with V4L2Capture instead of cv2.VideoCapture
+        # v4l2-ctl is resolved on PATH once; the command prefix is built once and reused per call
+        self._v4l2_ctl_path = shutil.which('v4l2-ctl')
+        self._v4l2_prefix = ('v4l2-ctl', '-d', str(self.device_index))
         # Validate initial values against known ranges from v4l2-ctl
         self.initial_exposure = max(1, min(initial_exposure, 65523)) # min=1, max=65523
         self.initial_framerate = max(5, min(initial_framerate, 120)) # min=5, max=120
 
         self.cap = None
+        self._v4l2_fd = None  # Control-only file descriptor for direct VIDIOC_S_CTRL ioctls
+        self._v4l2_ctrl_ids = {}  # v4l2-ctl style control name -> V4L2 control id
         self.capture_thread = None
+        self.display_thread = None
         self.running = True
         self.frame = None  # Stores the latest OpenCV frame
 
+        # Three capture slots: the grab thread fills a slot that is neither the latest published one
+        # nor the one the display thread is converting, then publishes it under the lock. The lock
+        # only guards the slot indices, so neither thread holds it while working on pixels.
+        # The condition is notified on every publish and paste so the display thread wakes up without polling.
+        self._frame_cond = threading.Condition()
+        self._frame_bufs = [None, None, None]
+        self._latest_idx = 0
+        self._display_idx = None  # Slot currently being converted by the display thread
+        self._frame_seq = 0  # Incremented on every published frame
+        self._paste_pending = False  # True while the Tk thread still has to paste _rgba_buf
+
+        # The preview is capped at the display refresh rate, independently of the capture FPS
+        self.render_interval = 1 / 60
+        self._last_render_ts = 0
+        self._use_umat = False  # Run the preview resize/convert through OpenCV's T-API (OpenCL)
+        self._use_fused = False  # Run the preview resize/convert as one Numba kernel
+        self._use_pil_resize = False  # Resize the preview with Pillow-SIMD
+        self.preview_filter = Image.BILINEAR
+
         # Tkinter variables for camera properties (bound to sliders AND entry fields)
         self.exposure_var = tk.IntVar(value=self.initial_exposure)
         self.framerate_var = tk.IntVar(value=self.initial_framerate)
+        self.fps_var = tk.StringVar(value="Live FPS: --")
+        self._frame_dt_ewma = 0.0 # Smoothed frame interval in seconds, updated by the grab thread
 
         # These variables hold the *desired* values that will be pushed to the camera
         # They are updated only when an "Apply" button is pressed or initially on camera open.
         self._desired_exposure = self.initial_exposure
         self._desired_framerate = self.initial_framerate
+        # Slider values waiting for the drag to settle before being applied
+        self._pending_apply = {}
+        self._pending_apply_id = None
 
         # Video recording variables
         self.is_recording = False
         self.video_writer = None
         self.fourcc = cv2.VideoWriter_fourcc(*'MJPG') 
         self.record_fps_target = self._desired_framerate # Target FPS for video writer
+        self.writer_thread = None
+        self._capture_mjpg = False  # True when the driver accepted the MJPG capture format
+        self._raw_jpeg_ok = False  # True when the backend can hand out undecoded JPEGs
+        # MJPG passthrough recording: the sensor's JPEGs are muxed into the AVI as-is with PyAV
+        self._passthrough = False
+        self._raw_capture = False  # Grab-thread side: cap currently returns undecoded JPEGs
+        self._latest_jpeg = None  # Newest undecoded JPEG while capturing raw (for snapshots)
+        self._av_container = None
+        self._av_stream = None
+        self._rec_pts = 0
+
+        # SPSC ring between the grab thread (producer) and writer_thread (consumer).
+        # Frames live in [_rec_tail, _rec_head); when the ring is full the oldest frame is dropped.
+        # The writer swaps the slot it is encoding for _rec_spare, so the producer never
+        # overwrites a frame that is still being written.
+        self._rec_cond = threading.Condition()
+        self._rec_ring = []
+        self._rec_spare = None
+        self._rec_head = 0
+        self._rec_tail = 0
+        self._rec_dropped = 0
+        self._rec_stop = True
+        self._rec_error = None  # Exception that made the writer thread give up
+        self._rec_error_reported = False
         self.camera_resolution = (640, 480) # Default, will be updated by camera
 
         self.create_widgets()
         self.open_camera()
+        self._init_display_buffers()
         self.start_capture_thread()
 
     def create_widgets(self):
@@ -53,7 +306,8 @@ class ArducamGUIController:
         # Row 0: Exposure
         ttk.Label(control_frame, text="Exposure (us):").grid(row=0, column=0, padx=5, pady=2, sticky=W)
         self.exposure_scale = ttk.Scale(control_frame, from_=1, to=65523, orient="horizontal",
-                                         variable=self.exposure_var, length=200) # Removed command
+                                         variable=self.exposure_var, length=200,
+                                         command=lambda val: self._on_slider_moved("exposure", val))
         self.exposure_scale.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
         
         # New: Exposure Entry
@@ -67,7 +321,8 @@ class ArducamGUIController:
         # Row 1: Framerate
         ttk.Label(control_frame, text="Frame Rate (FPS):").grid(row=1, column=0, padx=5, pady=2, sticky=W)
         self.framerate_scale = ttk.Scale(control_frame, from_=5, to=120, orient="horizontal",
-                                          variable=self.framerate_var, length=200) # Removed command
+                                          variable=self.framerate_var, length=200,
+                                          command=lambda val: self._on_slider_moved("frame_rate", val))
         self.framerate_scale.grid(row=1, column=1, padx=5, pady=2, sticky="ew")
         
         # New: Framerate Entry
@@ -77,6 +332,9 @@ class ArducamGUIController:
         # New: Framerate Apply Button
         ttk.Button(control_frame, text="Apply Framerate", command=self.apply_framerate).grid(row=1, column=3, padx=5, pady=2)
         
+        # Row 2: Live FPS readout
+        ttk.Label(control_frame, textvariable=self.fps_var).grid(row=2, column=0, columnspan=4, padx=5, pady=2, sticky=W)
+
         control_frame.columnconfigure(1, weight=1) # Allow slider to expand
 
         # --- Action Buttons Frame ---
@@ -97,35 +355,97 @@ class ArducamGUIController:
         self.canvas_height = 480
         self.canvas = tk.Canvas(self.root, width=self.canvas_width, height=self.canvas_height, bg="black")
         self.canvas.grid(row=2, column=0, padx=10, pady=10)
+        # The preview image item is created once, centered, and only its image is updated afterwards
+        self._canvas_cx = self.canvas_width // 2
+        self._canvas_cy = self.canvas_height // 2
+        self._canvas_img_id = self.canvas.create_image(self._canvas_cx, self._canvas_cy, anchor=tk.CENTER)
+
+    def _open_v4l2_controls(self):
+        """Open the device for control ioctls and map v4l2-ctl control names to their ids."""
+        try:
+            self._v4l2_fd = os.open(f"/dev/video{self.device_index}", os.O_RDWR | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Warning: Could not open /dev/video{self.device_index} for controls ({e}). Using v4l2-ctl.")
+            self._v4l2_fd = None
+            return
+
+        ctrl_id = V4L2_CTRL_FLAG_NEXT_CTRL
+        while True:
+            buf = bytearray(struct.pack(V4L2_QUERYCTRL_FORMAT, ctrl_id, 0, b"", 0, 0, 0, 0, 0))
+            try:
+                fcntl.ioctl(self._v4l2_fd, VIDIOC_QUERYCTRL, buf)
+            except OSError:
+                break # EINVAL marks the end of the control list
+            found_id, ctrl_type, raw_name = struct.unpack_from(V4L2_QUERYCTRL_FORMAT, buf)[:3]
+            # 64-bit controls can't be set with VIDIOC_S_CTRL, leave those to v4l2-ctl
+            if ctrl_type != V4L2_CTRL_TYPE_INTEGER64:
+                # v4l2-ctl derives names by lowercasing and collapsing each run of non-alphanumerics into '_'
+                name = raw_name.split(b"\0", 1)[0].decode(errors="replace").lower()
+                name = re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+                self._v4l2_ctrl_ids[name] = found_id
+            ctrl_id = found_id | V4L2_CTRL_FLAG_NEXT_CTRL
+
+    def _close_v4l2_controls(self):
+        if self._v4l2_fd is not None:
+            os.close(self._v4l2_fd)
+            self._v4l2_fd = None
+            self._v4l2_ctrl_ids = {}
 
     def _set_v4l2_control(self, control_name, value):
-        """Helper to set a V4L2 control using v4l2-ctl subprocess."""
-        command = [
-            'v4l2-ctl',
-            '-d', str(self.device_index),
-            '-c', f"{control_name}={value}"
-        ]
+        """Helper to set a V4L2 control, via ioctl when possible, else by spawning v4l2-ctl."""
+        ctrl_id = self._v4l2_ctrl_ids.get(control_name)
+        if self._v4l2_fd is not None and ctrl_id is not None:
+            try:
+                fcntl.ioctl(self._v4l2_fd, VIDIOC_S_CTRL, struct.pack("Ii", ctrl_id, value))
+                return
+            except OSError as e:
+                print(f"Warning: ioctl for '{control_name}={value}' failed ({e}). Retrying with v4l2-ctl.")
+
+        if self._v4l2_ctl_path is None:
+            messagebox.showerror("Error", "v4l2-ctl command not found. Please install v4l2-utils (sudo apt install v4l2-utils).")
+            self.running = False # Critical error, stop the application.
+            return
+
+        command = self._v4l2_prefix + ('-c', f"{control_name}={value}")
+        # posix_spawn avoids duplicating this process's address space just to exec v4l2-ctl.
+        # stdout is discarded, stderr is collected through a pipe for error reporting.
+        err_r, err_w = os.pipe()
         try:
-            # Use check_output for potential errors, but don't print stdout/stderr
-            # unless an error occurs or for debugging.
-            subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            # print(f"Successfully ran: {' '.join(command)}") # Uncomment for verbose debugging
-        except subprocess.CalledProcessError as e:
+            pid = os.posix_spawn(self._v4l2_ctl_path, command, os.environ, file_actions=[
+                (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                (os.POSIX_SPAWN_DUP2, err_w, 2),
+                (os.POSIX_SPAWN_CLOSE, err_r),
+                (os.POSIX_SPAWN_CLOSE, err_w),
+            ])
+        except OSError as e:
+            os.close(err_r)
+            print(f"Error running v4l2-ctl for '{control_name}={value}': {e}")
+            return
+        finally:
+            os.close(err_w)
+
+        with os.fdopen(err_r, 'rb') as err_pipe:
+            stderr = err_pipe.read()
+        _, status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
             print(f"Error setting V4L2 control '{control_name}={value}':")
-            print(f"Command: {' '.join(e.cmd)}")
-            print(f"Stdout: {e.stdout.decode().strip()}")
-            print(f"Stderr: {e.stderr.decode().strip()}")
+            print(f"Command: {' '.join(command)}")
+            print(f"Stderr: {stderr.decode().strip()}")
             # We don't want a pop-up every loop if an error happens.
             # messagebox.showerror("V4L2 Control Error", 
-            #                      f"Failed to set {control_name} to {value}:\n{e.stderr.decode().strip()}")
-        except FileNotFoundError:
-            messagebox.showerror("Error", "v4l2-ctl command not found. Please install v4l2-utils (sudo apt install v4l2-utils).")
-            self.running = False # Critical error, stop the application.
-
+            #                      f"Failed to set {control_name} to {value}:\n{stderr.decode().strip()}")
 
     def open_camera(self):
-        print(f"Attempting to open camera device: {self.device_index} with CAP_V4L2 backend")
-        self.cap = cv2.VideoCapture(self.device_index, cv2.CAP_V4L2)
+        if self.direct_capture:
+            print(f"Attempting to open camera device: {self.device_index} with direct V4L2 streaming")
+            try:
+                self.cap = V4L2Capture(self.device_index)
+            except OSError as e:
+                print(f"Warning: Direct V4L2 capture unavailable ({e}). Falling back to CAP_V4L2 backend.")
+                self.cap = None
+        if self.cap is None:
+            print(f"Attempting to open camera device: {self.device_index} with CAP_V4L2 backend")
+            self.cap = cv2.VideoCapture(self.device_index, cv2.CAP_V4L2)
 
         if not self.cap.isOpened():
             messagebox.showerror("Camera Error", f"Failed to open camera device {self.device_index}. "
@@ -133,11 +453,25 @@ class ArducamGUIController:
             self.running = False
             return
 
-        # Set initial settings using v4l2-ctl subprocess command
-        print(f"Setting initial exposure via v4l2-ctl to {self._desired_exposure} us")
+        self._open_v4l2_controls()
+
+        # Keep only one frame queued in the driver so the preview/recording never lags
+        # several frames behind the sensor (OpenCV's V4L2 backend defaults to 4 buffers).
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        # Ask the driver for MJPG so frames arrive pre-compressed instead of raw YUYV.
+        self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self._capture_mjpg = int(self.cap.get(cv2.CAP_PROP_FOURCC)) == cv2.VideoWriter_fourcc(*'MJPG')
+        self._raw_jpeg_ok = self._capture_mjpg and self._probe_raw_jpeg()
+        print(f"Capture buffer size: {int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE))}")
+
+        self._use_umat = cv2.ocl.haveOpenCL() and cv2.ocl.useOpenCL()
+        print(f"OpenCL preview path: {'enabled' if self._use_umat else 'disabled'}")
+
+        # Set initial settings (ioctl, or v4l2-ctl as a fallback)
+        print(f"Setting initial exposure to {self._desired_exposure} us")
         self._set_v4l2_control("exposure", self._desired_exposure)
         
-        print(f"Setting initial framerate via v4l2-ctl to {self._desired_framerate} FPS")
+        print(f"Setting initial framerate to {self._desired_framerate} FPS")
         self._set_v4l2_control("frame_rate", self._desired_framerate)
 
         # Get actual camera resolution once camera is open
@@ -148,90 +482,252 @@ class ArducamGUIController:
                                   int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
         print(f"Camera resolution detected: {self.camera_resolution[0]}x{self.camera_resolution[1]}")
 
+    def _probe_raw_jpeg(self):
+        """Check once, before the grab thread starts, that disabling CONVERT_RGB really yields JPEGs."""
+        if not self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            return False
+        ret, buf = self.cap.read()
+        self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        ok = ret and self._is_jpeg_buffer(buf)
+        if not ok:
+            print("Note: Capture backend doesn't deliver raw MJPG; recordings will be re-encoded.")
+        return ok
+
+    @staticmethod
+    def _is_jpeg_buffer(buf):
+        # Raw MJPG arrives as a 1-D (or 1xN) byte array starting with the JPEG SOI marker
+        if buf is None or not (buf.ndim == 1 or buf.shape[0] == 1):
+            return False
+        data = buf.reshape(-1)
+        return data.size > 2 and data[0] == 0xFF and data[1] == 0xD8
+
+    def _init_display_buffers(self):
+        """Compute the preview size once and pre-allocate the per-frame buffers."""
+        w, h = self.camera_resolution
+        self.display_w, self.display_h = w, h
+        self.aspect_ratio = w / h
+
+        if w > self.canvas_width or h > self.canvas_height:
+            if self.aspect_ratio > (self.canvas_width / self.canvas_height):
+                self.display_w = self.canvas_width
+                self.display_h = int(self.canvas_width / self.aspect_ratio)
+            else:
+                self.display_h = self.canvas_height
+                self.display_w = int(self.canvas_height * self.aspect_ratio)
+
+        # Frames that already fit the canvas (e.g. 640x480 sensors) are converted without resizing
+        self._needs_resize = (self.display_w, self.display_h) != (w, h)
+
+        # Resize first, then convert the (smaller) image, reusing the same buffers every frame
+        self._resized_bgr = np.empty((self.display_h, self.display_w, 3), dtype=np.uint8)
+        # PIL stores RGB with 4 bytes per pixel, so only a 4-channel buffer can be shared zero-copy
+        self._rgba_buf = np.full((self.display_h, self.display_w, 4), 255, dtype=np.uint8)
+        # frombuffer with the 'raw' decoder maps _rgba_buf's memory (it must stay C-contiguous),
+        # so this one PIL image always shows the latest converted frame without any copy
+        self._preview_img = Image.frombuffer('RGBA', (self.display_w, self.display_h),
+                                             self._rgba_buf, 'raw', 'RGBA', 0, 1)
+        # A single PhotoImage is reused for the whole session; frames are pasted into it.
+        # Matching modes avoid a conversion, but paste() still makes one copy per frame because
+        # a buffer-mapped image is not a contiguous image block.
+        self.photo = ImageTk.PhotoImage('RGBA', (self.display_w, self.display_h))
+        self.canvas.itemconfig(self._canvas_img_id, image=self.photo)
+
+        self._frame_bufs = [np.empty((h, w, 3), dtype=np.uint8) for _ in range(3)]
+
+        # Compile the fused kernel now rather than stalling on the first displayed frame
+        self._use_fused = fused_bgr_resize_rgba is not None and self._needs_resize and not self._use_umat
+        if self._use_fused:
+            fused_bgr_resize_rgba(self._frame_bufs[0], self._rgba_buf)
+        self._use_pil_resize = PILLOW_SIMD and self._needs_resize and not (self._use_umat or self._use_fused)
+
     def start_capture_thread(self):
         if not self.running:
             return
         self.capture_thread = threading.Thread(target=self.update_frame_loop, daemon=True)
         self.capture_thread.start()
+        self._tune_capture_thread(self.capture_thread.native_id)
+        self.display_thread = threading.Thread(target=self.display_loop, daemon=True)
+        self.display_thread.start()
+
+    def _tune_capture_thread(self, tid):
+        """Pin the grab thread to the last CPU and raise its priority to reduce frame jitter (Linux only)."""
+        if not hasattr(os, "sched_setaffinity"):
+            return
+        cpus = os.sched_getaffinity(0)
+        if len(cpus) > 1:
+            # The Tk main thread keeps the remaining cores
+            try:
+                os.sched_setaffinity(tid, {max(cpus)})
+            except OSError as e:
+                print(f"Warning: Could not pin capture thread to CPU {max(cpus)}: {e}")
+        try:
+            # On Linux the nice value is per thread; os.nice() would renice the calling (Tk) thread
+            os.setpriority(os.PRIO_PROCESS, tid, -5)
+        except OSError:
+            print("Note: Capture thread priority unchanged (raising it needs CAP_SYS_NICE or root).")
 
     def update_frame_loop(self):
-        frame_count = 0
-        start_time = time.time()
-        
-        # Keep track of last values *actually pushed* to v4l2-ctl to avoid spamming the command
-        last_pushed_exposure = -1
-        last_pushed_framerate = -1
+        last_frame_ts = time.monotonic()
+        last_report_ts = last_frame_ts
 
+        # Controls are pushed from the Tk thread by the Apply buttons, so this loop only grabs frames
         while self.running:
             if self.cap is None or not self.cap.isOpened():
                 time.sleep(0.1) 
                 continue
 
-            # Continuously ensure the camera is set to the desired values
-            # These are pushed via v4l2-ctl, not OpenCV's cap.set()
-            if self._desired_exposure != last_pushed_exposure:
-                self._set_v4l2_control("exposure", self._desired_exposure)
-                last_pushed_exposure = self._desired_exposure
-
-            if self._desired_framerate != last_pushed_framerate:
-                self._set_v4l2_control("frame_rate", self._desired_framerate)
-                last_pushed_framerate = self._desired_framerate
+            # Switch between decoded and raw JPEG delivery from this thread, between two reads.
+            # Once a passthrough recording has failed, don't retry until the Tk thread stops it.
+            if self._passthrough != self._raw_capture and not (self._passthrough and self._rec_stop):
+                if self.cap.set(cv2.CAP_PROP_CONVERT_RGB, 0 if self._passthrough else 1):
+                    self._raw_capture = self._passthrough
+                    with self._frame_cond:
+                        self._latest_jpeg = None
+                elif self._passthrough:
+                    self._fail_recording(RuntimeError("Capture backend refused raw MJPG delivery"))
+            raw_capture = self._raw_capture
 
-
-            ret, frame = self.cap.read()
+            with self._frame_cond:
+                back_idx = next(i for i in range(3) if i not in (self._latest_idx, self._display_idx))
+            frame = None
+            if raw_capture:
+                ret, jpeg = self.cap.read()
+            else:
+                ret, frame = self.cap.read(self._frame_bufs[back_idx])
             if not ret:
                 print("Failed to grab frame. Camera might be disconnected or error occurred.")
                 time.sleep(1)
                 continue
 
-            self.frame = frame  # Store the latest frame
+            if raw_capture and not self._is_jpeg_buffer(jpeg):
+                # The backend ignored CONVERT_RGB and returned a decoded frame: never mux or
+                # imdecode it, just show it and stop the passthrough recording
+                frame, raw_capture = jpeg, False
+                self._fail_recording(RuntimeError("Capture backend returned decoded frames instead of MJPG"))
+            elif raw_capture:
+                with self._frame_cond:
+                    self._latest_jpeg = jpeg
+                # JPEGs only go to the file; decode just the ones the preview is about to show
+                if self._preview_wants_frame():
+                    frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
 
-            # If recording, write frame to video file
-            if self.is_recording and self.video_writer is not None and self.video_writer.isOpened():
-                self.video_writer.write(frame)
+            if frame is not None:
+                # cap.read() reallocates if the driver delivers a different size than reported
+                self._frame_bufs[back_idx] = frame
+                with self._frame_cond:
+                    self._latest_idx = back_idx
+                    self._frame_seq += 1
+                    self.frame = frame  # Store the latest frame
+                    self._frame_cond.notify()
 
-            # Update FPS calculation in terminal
-            frame_count += 1
-            elapsed_time = time.time() - start_time
-            if elapsed_time >= 1.0:
-                fps = frame_count / elapsed_time
-                print(f"Live Stream FPS: {fps:.2f} (Desired: {self._desired_framerate:.0f})")
-                frame_count = 0
-                start_time = time.time()
+            # If recording, hand the frame (or its original JPEG in passthrough mode) to the writer thread
+            if self.is_recording and raw_capture == self._passthrough:
+                self._push_record_frame(jpeg.tobytes() if raw_capture else frame)
 
-            # Prepare frame for Tkinter display (in main thread using after())
-            if frame is not None:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                h, w = frame_rgb.shape[:2]
-                display_w, display_h = w, h 
-
-                if w > self.canvas_width or h > self.canvas_height:
-                    aspect_ratio = w / h
-                    if aspect_ratio > (self.canvas_width / self.canvas_height):
-                        display_w = self.canvas_width
-                        display_h = int(self.canvas_width / aspect_ratio)
-                    else:
-                        display_h = self.canvas_height
-                        display_w = int(self.canvas_height * aspect_ratio)
-                
-                display_frame_resized = cv2.resize(frame_rgb, (display_w, display_h))
-                img = Image.fromarray(display_frame_resized)
-                img_tk = ImageTk.PhotoImage(image=img)
-                
-                self.root.after(0, self.update_canvas, img_tk, display_w, display_h)
+            # Update the smoothed FPS; the label (and console, if verbose) is refreshed once a second
+            now = time.monotonic()
+            # Smooth the interval, not 1/dt: bursty arrivals would otherwise inflate the rate
+            dt = now - last_frame_ts
+            if self._frame_dt_ewma == 0:
+                self._frame_dt_ewma = dt # Seed with the first interval instead of ramping up from 0
+            else:
+                self._frame_dt_ewma += 0.1 * (dt - self._frame_dt_ewma)
+            last_frame_ts = now
+            if now - last_report_ts >= 1.0 and self._frame_dt_ewma > 0:
+                fps_text = f"Live FPS: {1.0 / self._frame_dt_ewma:.2f} (Desired: {self._desired_framerate:.0f})"
+                self.root.after(0, self.fps_var.set, fps_text)
+                if self.verbose:
+                    print(fps_text)
+                last_report_ts = now
 
-            time.sleep(0.01) # Small delay to yield CPU
+            # No sleep here: cap.read() blocks until the next frame is ready
 
         print("Capture thread stopped.")
         self.release_resources()
 
-    def update_canvas(self, img_tk, img_w, img_h):
-        self.photo = img_tk
-        x_center = self.canvas_width // 2
-        y_center = self.canvas_height // 2
-        self.canvas.delete("all")
-        self.canvas.create_image(x_center, y_center, image=self.photo, anchor=tk.CENTER)
+    def _preview_wants_frame(self):
+        """True when the display thread would render a frame published now."""
+        return not self._paste_pending and time.monotonic() - self._last_render_ts >= self.render_interval
+
+    def display_loop(self):
+        """Render the newest published frame for the preview, independently of the grab thread."""
+        last_seq = 0
+
+        while self.running:
+            # Wait for a new frame, and for the Tk thread to have consumed the previous one
+            with self._frame_cond:
+                ready = self._frame_cond.wait_for(
+                    lambda: (self._frame_seq != last_seq and not self._paste_pending) or not self.running,
+                    timeout=0.1)
+            if not ready or not self.running:
+                continue
+
+            # Frames arriving faster than the screen can show them are never converted
+            wait = self.render_interval - (time.monotonic() - self._last_render_ts)
+            if wait > 0:
+                time.sleep(wait)
+                continue
+            self._last_render_ts = time.monotonic()
+
+            # Claim the newest slot; the grab thread leaves it alone until it is released below
+            with self._frame_cond:
+                last_seq = self._frame_seq
+                self._display_idx = self._latest_idx
+                frame = self._frame_bufs[self._display_idx]
+
+            if self._use_umat:
+                umat = cv2.UMat(frame)
+                if self._needs_resize:
+                    umat = cv2.resize(umat, (self.display_w, self.display_h))
+                # Only the small converted preview is downloaded back to host memory
+                np.copyto(self._rgba_buf, cv2.cvtColor(umat, cv2.COLOR_BGR2RGBA).get())
+            elif self._use_fused:
+                fused_bgr_resize_rgba(frame, self._rgba_buf)
+            elif self._use_pil_resize:
+                # The raw decoder swaps BGR->RGB while copying the frame into PIL
+                h, w = frame.shape[:2]
+                pil_frame = Image.frombuffer('RGB', (w, h), frame, 'raw', 'BGR', 0, 1)
+                # Alpha is preset to 255, so only the color channels are written
+                resized = pil_frame.resize((self.display_w, self.display_h), self.preview_filter)
+                self._rgba_buf[:, :, :3] = np.asarray(resized)
+            elif self._needs_resize:
+                cv2.resize(frame, (self.display_w, self.display_h), dst=self._resized_bgr)
+                cv2.cvtColor(self._resized_bgr, cv2.COLOR_BGR2RGBA, dst=self._rgba_buf)
+            else:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA, dst=self._rgba_buf)
+
+            with self._frame_cond:
+                self._display_idx = None
+
+            # Paste in main thread using after()
+            self._paste_pending = True
+            self.root.after(0, self.update_canvas)
+
+        print("Display thread stopped.")
+
+    def update_canvas(self):
+        # Pasting into the PhotoImage already shown by the canvas item redraws it in place
+        self.photo.paste(self._preview_img)
+        with self._frame_cond:
+            self._paste_pending = False
+            self._frame_cond.notify()
+
+    def _on_slider_moved(self, control_name, val):
+        """Record the slider position and (re)start the debounce timer instead of applying right away."""
+        self._pending_apply[control_name] = int(float(val))
+        if self._pending_apply_id is not None:
+            self.root.after_cancel(self._pending_apply_id)
+        self._pending_apply_id = self.root.after(SLIDER_DEBOUNCE_MS, self._flush_pending_apply)
+
+    def _flush_pending_apply(self):
+        self._pending_apply_id = None
+        pending, self._pending_apply = self._pending_apply, {}
+        if "exposure" in pending:
+            self.exposure_var.set(pending["exposure"])
+            self.apply_exposure()
+        if "frame_rate" in pending:
+            self.framerate_var.set(pending["frame_rate"])
+            self.apply_framerate()
 
     # Method to apply exposure setting (triggered by button)
     def apply_exposure(self):
@@ -243,7 +739,8 @@ class ArducamGUIController:
 
             if val != self._desired_exposure: # Only update if new desired value is different
                 self._desired_exposure = val # Store the new *target* value
-                print(f"Exposure 'Apply' clicked. Desired exposure set to: {val} us")
+                print(f"Exposure set to: {val} us")
+                self._set_v4l2_control("exposure", val)
         except tk.TclError: # Catches non-integer input in Entry
             messagebox.showerror("Invalid Input", "Please enter an integer value for exposure.")
 
@@ -258,18 +755,161 @@ class ArducamGUIController:
             if val != self._desired_framerate:
                 self._desired_framerate = val # Store the new *target* value
                 self.record_fps_target = val # Also update target for recording
-                print(f"Framerate 'Apply' clicked. Desired framerate set to: {val} FPS")
+                print(f"Framerate set to: {val} FPS")
+                self._set_v4l2_control("frame_rate", val)
         except tk.TclError: # Catches non-integer input in Entry
             messagebox.showerror("Invalid Input", "Please enter an integer value for framerate.")
 
+    def _push_record_frame(self, frame):
+        """Copy a frame into the recording ring, dropping the oldest queued frame if it is full."""
+        mask = RECORD_RING_SIZE - 1
+        with self._rec_cond:
+            if self._rec_stop:
+                # Recording was stopped after the caller checked is_recording, or the writer failed.
+                # The writer thread must not call into Tk, so the failure is reported from here.
+                self._report_record_error()
+                return
+            if self._rec_head - self._rec_tail == RECORD_RING_SIZE:
+                self._rec_tail += 1 # Drop oldest
+                self._rec_dropped += 1
+            slot = self._rec_ring[self._rec_head & mask]
+            if isinstance(frame, bytes) or slot is None or frame.shape != slot.shape:
+                self._rec_ring[self._rec_head & mask] = frame if isinstance(frame, bytes) else frame.copy()
+            else:
+                np.copyto(slot, frame)
+            self._rec_head += 1
+            self._rec_cond.notify()
+
+    def _report_record_error(self):
+        # Called with _rec_cond held, from the grab thread
+        if self._rec_error is not None and not self._rec_error_reported:
+            self._rec_error_reported = True
+            self.root.after(0, self._on_record_error)
+
+    def _fail_recording(self, error):
+        """Abort the current recording from the grab thread; the Tk thread reports it."""
+        with self._rec_cond:
+            if self._rec_stop:
+                return  # Already failed or being stopped, report only once
+            print(f"Recording error: {error}")
+            if self._rec_error is None:
+                self._rec_error = error
+            self._rec_stop = True
+            self._rec_cond.notify()
+            self._report_record_error()
+
+    def record_writer_loop(self):
+        """Drain the recording ring into the video writer until recording stops."""
+        mask = RECORD_RING_SIZE - 1
+        while True:
+            with self._rec_cond:
+                while self._rec_head == self._rec_tail and not self._rec_stop:
+                    self._rec_cond.wait()
+                if self._rec_head == self._rec_tail:
+                    break # Stopped and fully drained
+                slot = self._rec_tail & mask
+                frame = self._rec_ring[slot]
+                self._rec_ring[slot] = self._rec_spare
+                self._rec_tail += 1
+
+            try:
+                if self._av_container is not None:
+                    packet = av.Packet(frame)
+                    packet.stream = self._av_stream
+                    packet.time_base = self._av_stream.time_base
+                    packet.pts = packet.dts = self._rec_pts
+                    self._rec_pts += 1
+                    self._av_container.mux(packet)
+                else:
+                    self.video_writer.write(frame)
+                    self._rec_spare = frame
+            except Exception as e:
+                print(f"Error writing video frame: {e}")
+                with self._rec_cond:
+                    self._rec_error = e
+                    self._rec_stop = True # The grab thread stops queueing and reports the failure
+                break
+
+        print("Writer thread stopped.")
+
+    def _start_record_writer(self, passthrough=False):
+        width, height = self.camera_resolution
+        if passthrough:
+            # JPEG bytes are stored by reference, no frame buffers needed
+            self._rec_ring = [None] * RECORD_RING_SIZE
+            self._rec_spare = None
+        else:
+            self._rec_ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(RECORD_RING_SIZE)]
+            self._rec_spare = np.empty((height, width, 3), dtype=np.uint8)
+        self._rec_head = self._rec_tail = self._rec_dropped = self._rec_pts = 0
+        with self._rec_cond:
+            self._rec_error = None
+            self._rec_error_reported = False
+            self._rec_stop = False
+        # Published only after the reset, so a grab-thread failure can't be wiped by it
+        self._passthrough = passthrough
+        self.writer_thread = threading.Thread(target=self.record_writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def _stop_record_writer(self):
+        """Let the writer thread flush the queued frames, then release the video writer."""
+        with self._rec_cond:
+            self._rec_stop = True
+            self._rec_cond.notify()
+        if self.writer_thread and self.writer_thread.is_alive():
+            # No timeout: at most RECORD_RING_SIZE frames are left to write, and the writer
+            # objects must not be released while the thread may still be using them
+            self.writer_thread.join()
+        self.writer_thread = None
+        if self.video_writer:
+            self.video_writer.release()
+            self.video_writer = None
+        if self._av_container is not None:
+            self._av_container.close()
+            self._av_container = None
+            self._av_stream = None
+        self._passthrough = False
+        self._rec_ring = []
+        self._rec_spare = None
+        if self._rec_error is not None:
+            print(f"Recording aborted after a write error: {self._rec_error}")
+        elif self._rec_dropped:
+            print(f"Warning: {self._rec_dropped} frames dropped while recording (disk too slow).")
+
+    def _on_record_error(self):
+        """Stop a recording that failed while capturing or writing and tell the user (runs on the Tk thread)."""
+        if not self.is_recording:
+            return
+        self.is_recording = False
+        self.record_button.config(text="Start Recording", style="TButton")
+        error = self._rec_error
+        self._stop_record_writer()
+        messagebox.showerror("Recording Error", f"Recording stopped: {error}")
+
+    def _open_passthrough_writer(self, video_filepath, record_fps):
+        """Open an AVI container whose MJPEG stream takes the camera's JPEGs without re-encoding."""
+        width, height = self.camera_resolution
+        self._av_container = av.open(video_filepath, mode='w', format='avi')
+        self._av_stream = self._av_container.add_stream('mjpeg', rate=record_fps)
+        self._av_stream.width = width
+        self._av_stream.height = height
+        self._av_stream.pix_fmt = 'yuvj422p'
+        self._av_stream.time_base = Fraction(1, record_fps)
+
     def save_image(self):
-        if self.frame is not None:
+        with self._frame_cond:
+            jpeg = self._latest_jpeg
+            frame = self.frame.copy() if jpeg is None and self.frame is not None else None
+        if jpeg is not None:
+            # Passthrough recording: the newest frame may not have been decoded yet
+            frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+        if frame is not None:
             output_dir = "captured_images"
             os.makedirs(output_dir, exist_ok=True)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = os.path.join(output_dir, f"capture_{timestamp}.png")
             try:
-                cv2.imwrite(filename, self.frame)
+                cv2.imwrite(filename, frame)
                 messagebox.showinfo("Image Saved", f"Image saved as {filename}")
             except Exception as e:
                 messagebox.showerror("Save Error", f"Failed to save image: {e}")
@@ -301,25 +941,32 @@ class ArducamGUIController:
                 # Use _desired_framerate for recording target FPS as this is what we're applying
                 record_fps = self._desired_framerate if self._desired_framerate > 0 else 30 
                 
-                self.video_writer = cv2.VideoWriter(video_filepath, self.fourcc, 
-                                                    record_fps, (width, height))
-                
-                if not self.video_writer.isOpened():
-                    raise IOError("Failed to open video writer. Check codec (MJPG recommended) and permissions.")
+                if self._raw_jpeg_ok and av is not None:
+                    # The camera already delivers MJPG, so store its frames without decode/re-encode
+                    self._open_passthrough_writer(video_filepath, record_fps)
+                else:
+                    self.video_writer = cv2.VideoWriter(video_filepath, self.fourcc, 
+                                                        record_fps, (width, height))
+
+                    if not self.video_writer.isOpened():
+                        raise IOError("Failed to open video writer. Check codec (MJPG recommended) and permissions.")
 
+                self._start_record_writer(passthrough=self._av_container is not None)
                 self.is_recording = True
                 self.record_button.config(text="Stop Recording", style="Red.TButton")
-                print(f"Recording started to {video_filepath} at {record_fps} FPS. Resolution: {width}x{height}")
+                mode = "MJPG passthrough" if self._passthrough else "MJPG re-encode"
+                print(f"Recording started to {video_filepath} at {record_fps} FPS ({mode}). Resolution: {width}x{height}")
             except Exception as e:
                 messagebox.showerror("Recording Error", f"Failed to start recording: {e}")
                 if self.video_writer: self.video_writer.release()
                 self.video_writer = None
+                if self._av_container is not None: self._av_container.close()
+                self._av_container = None
+                self._passthrough = False
         else:
             self.is_recording = False
             self.record_button.config(text="Start Recording", style="TButton")
-            if self.video_writer:
-                self.video_writer.release()
-                self.video_writer = None
+            self._stop_record_writer()
             print("Recording stopped.")
             messagebox.showinfo("Recording Stopped", "Video recording has been stopped.")
 
@@ -327,9 +974,10 @@ class ArducamGUIController:
         if self.cap:
             self.cap.release()
             print("Camera released.")
-        if self.is_recording and self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
+        self._close_v4l2_controls()
+        if self.is_recording:
+            self.is_recording = False
+            self._stop_record_writer()
             print("Video writer released upon exit.")
 
     def on_closing(self):
@@ -339,45 +987,32 @@ class ArducamGUIController:
                 self.capture_thread.join(timeout=5)
                 if self.capture_thread.is_alive():
                     print("Warning: Capture thread did not terminate cleanly.")
+            if self.display_thread and self.display_thread.is_alive():
+                self.display_thread.join(timeout=5)
+                if self.display_thread.is_alive():
+                    print("Warning: Display thread did not terminate cleanly.")
+            if self.writer_thread and self.writer_thread.is_alive():
+                self.writer_thread.join(timeout=5)
+                if self.writer_thread.is_alive():
+                    print("Warning: Writer thread did not terminate cleanly.")
             self.root.destroy()
 
 if __name__ == "__main__":
-    device_index = 0
-    initial_exposure = 800  # v4l2-ctl default
-    initial_framerate = 60 # v4l2-ctl default
-
-    # Command-line argument parsing
-    i = 1
-    while i < len(sys.argv):
-        arg = sys.argv[i]
-        if arg == '-v':
-            if i + 1 < len(sys.argv) and sys.argv[i+1].isdigit(): # Check if next arg is a digit
-                try:
-                    device_index = int(sys.argv[i+1])
-                    i += 1
-                except ValueError:
-                    print(f"Warning: Invalid device index '{sys.argv[i+1]}'. Using default 0.")
-            else:
-                print("Warning: -v requires a device index (e.g., -v 0). Using default 0.")
-        elif arg == '--exposure':
-            if i + 1 < len(sys.argv) and sys.argv[i+1].isdigit():
-                try:
-                    initial_exposure = int(sys.argv[i+1])
-                    i += 1
-                except ValueError:
-                    print(f"Warning: Invalid exposure value '{sys.argv[i+1]}'. Using default {initial_exposure}.")
-            else:
-                print("Warning: --exposure requires a numerical value.")
-        elif arg == '--framerate':
-            if i + 1 < len(sys.argv) and sys.argv[i+1].isdigit():
-                try:
-                    initial_framerate = int(sys.argv[i+1])
-                    i += 1
-                except ValueError:
-                    print(f"Warning: Invalid framerate value '{sys.argv[i+1]}'. Using default {initial_framerate}.")
-            else:
-                print("Warning: --framerate requires a numerical value.")
-        i += 1
+    parser = argparse.ArgumentParser(description="Arducam V4L2 GUI Controller")
+    parser.add_argument('-v', dest='device_index', type=int, default=0,
+                        help="Camera device index (e.g. 0 for /dev/video0)")
+    parser.add_argument('--exposure', type=int, default=800, # v4l2-ctl default
+                        help="Initial exposure in us (1 to 65523)")
+    parser.add_argument('--framerate', type=int, default=60, # v4l2-ctl default
+                        help="Initial frame rate in FPS (5 to 120)")
+    parser.add_argument('--verbose', action='store_true',
+                        help="Also print the live FPS to the console")
+    parser.add_argument('--direct-capture', action='store_true',
+                        help="Stream directly through V4L2 ioctls with a single buffer (MJPG/YUYV cameras)")
+    args = parser.parse_args()
+    device_index = args.device_index
+    initial_exposure = args.exposure
+    initial_framerate = args.framerate
 
     print(f"Starting Arducam GUI with: Device={device_index}, "
           f"Initial Exposure={initial_exposure}us, Initial Framerate={initial_framerate}FPS")
@@ -391,5 +1026,6 @@ if __name__ == "__main__":
               background=[('active', 'darkred'), ('!disabled', 'red')],
               foreground=[('active', 'white'), ('!disabled', 'white')])
 
-    app = ArducamGUIController(root, device_index, initial_exposure, initial_framerate)
+    app = ArducamGUIController(root, device_index, initial_exposure, initial_framerate, args.verbose,
+                               args.direct_capture)
     root.mainloop()
\ No newline at end of file